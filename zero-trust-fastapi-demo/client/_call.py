@@ -1,6 +1,12 @@
 import os
 import argparse
 import requests
+from requests.adapters import HTTPAdapter
+
+# One pooled session so sequential calls in a process reuse the same connection
+_SESSION = requests.Session()
+_SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
+_SESSION.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=32))
 
 def build_headers(token: str):
     headers = {}
@@ -15,6 +21,17 @@ def build_headers(token: str):
         headers["X-Risk"] = risk
     return headers
 
+def call(url: str, method: str = "GET", token: str = ""):
+    headers = build_headers(token)
+
+    if method == "GET":
+        r = _SESSION.get(url, headers=headers, timeout=10)
+    else:
+        r = _SESSION.post(url, headers=headers, timeout=10)
+
+    print(r.status_code)
+    print(r.text)
+
 def main():
     p = argparse.ArgumentParser()
     p.add_argument("--url", required=True)
@@ -22,15 +39,7 @@ def main():
     p.add_argument("--token", default=os.environ.get("TOKEN", ""))
     args = p.parse_args()
 
-    headers = build_headers(args.token)
-
-    if args.method == "GET":
-        r = requests.get(args.url, headers=headers, timeout=10)
-    else:
-        r = requests.post(args.url, headers=headers, timeout=10)
-
-    print(r.status_code)
-    print(r.text)
+    call(args.url, args.method, args.token)
 
 if __name__ == "__main__":
     main()
@@ -1,12 +1,9 @@
 import os
-import subprocess, sys
+
+from _call import call
 
 URL = os.environ.get("URL", "http://localhost:8000/orders")
 METHOD = "POST"
 TOKEN = os.environ.get("TOKEN", "")
 
-cmd = [sys.executable, os.path.join(os.path.dirname(__file__), "_call.py"), "--url", URL, "--method", METHOD]
-if TOKEN:
-    cmd += ["--token", TOKEN]
-
-subprocess.run(cmd, check=False)
+call(URL, METHOD, TOKEN)
@@ -1,5 +1,6 @@
 import argparse
-import requests
+
+from _call import _SESSION
 
 def main():
     p = argparse.ArgumentParser()
@@ -9,7 +10,7 @@ def main():
     args = p.parse_args()
 
     payload = {"username": args.user, "password": "pass", "role": args.role}
-    r = requests.post(args.auth_url, json=payload, timeout=10)
+    r = _SESSION.post(args.auth_url, json=payload, timeout=10)
     r.raise_for_status()
     print(r.json()["access_token"])
 
@@ -1,11 +1,38 @@
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import queue
+import sys
 import time
-from typing import Literal
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Literal
 
-from fastapi import FastAPI, HTTPException, Request
+import orjson
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import ORJSONResponse, Response
 from pydantic import BaseModel
-from jose import jwt
 
-app = FastAPI(title="auth-service", version="1.0.0")
+app = FastAPI(title="auth-service", version="1.0.0", default_response_class=ORJSONResponse)
+
+# Queue-backed logger: stdout writes happen on the listener thread, not the event loop.
+# LOG_LEVEL=WARNING turns the per-request lines off.
+logger = logging.getLogger(__name__)
+_log_level = logging.getLevelName(os.environ.get("LOG_LEVEL", "INFO").upper())
+logger.setLevel(_log_level if isinstance(_log_level, int) else logging.INFO)
+logger.propagate = False
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+logger.addHandler(QueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, logging.StreamHandler(sys.stdout))
+
+@app.on_event("startup")
+async def start_log_listener() -> None:
+    _log_listener.start()
+
+@app.on_event("shutdown")
+async def stop_log_listener() -> None:
+    _log_listener.stop()
 
 # Demo secret. In production: asymmetric keys + JWKS + rotation.
 JWT_ISSUER = "demo-auth"
@@ -14,26 +41,62 @@ JWT_SECRET = "dev-secret-change-me"
 JWT_ALG = "HS256"
 JWT_TTL_SECONDS = 10 * 60
 
+def _b64url(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+# The JOSE header and HMAC key never change, so only the payload is encoded per token
+_HEADER_B64 = _b64url(orjson.dumps({"alg": JWT_ALG, "typ": "JWT"}))
+_KEY = JWT_SECRET.encode()
+
+def sign_jwt(payload: dict[str, Any]) -> str:
+    signing_input = _HEADER_B64 + b"." + _b64url(orjson.dumps(payload))
+    sig = hmac.new(_KEY, signing_input, hashlib.sha256).digest()
+    return (signing_input + b"." + _b64url(sig)).decode("ascii")
+
+@app.on_event("startup")
+async def warm_up_signer() -> None:
+    # Prime hmac/orjson on a throwaway token so the first /token call isn't the slow one
+    sign_jwt({"iss": JWT_ISSUER, "aud": JWT_AUDIENCE, "exp": int(time.time()) + 60})
+
 class LoginRequest(BaseModel):
     username: str
     password: str
     role: Literal["reader", "admin"] = "reader"
 
-@app.middleware("http")
-async def request_log(request: Request, call_next):
-    start = time.time()
-    resp = await call_next(request)
-    elapsed_ms = int((time.time() - start) * 1000)
-    # Keep logs simple for demo visibility
-    print(f"{request.method} {request.url.path} -> {resp.status_code} ({elapsed_ms}ms)")
-    return resp
+class RequestLogMiddleware:
+    # Plain ASGI middleware: avoids the per-request task BaseHTTPMiddleware spawns
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        # Skip liveness/readiness probes so they don't flood the request log
+        if scope["type"] != "http" or scope["path"] == "/health":
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter_ns()
+        await self.app(scope, receive, send_wrapper)
+        elapsed_ms = (time.perf_counter_ns() - start) // 1_000_000
+        # Keep logs simple for demo visibility
+        logger.info("%s %s -> %s (%dms)", scope["method"], scope["path"], status_code, elapsed_ms)
+
+app.add_middleware(RequestLogMiddleware)
+
+_HEALTH_RESP_BYTES = b'{"ok":true}'
 
 @app.get("/health")
-def health():
-    return {"ok": True}
+async def health():
+    return Response(content=_HEALTH_RESP_BYTES, media_type="application/json")
 
 @app.post("/token")
-def token(req: LoginRequest):
+async def token(req: LoginRequest):
     # Demo auth: accept any username with password == "pass"
     if req.password != "pass":
         raise HTTPException(status_code=401, detail="invalid credentials")
@@ -53,5 +116,5 @@ def token(req: LoginRequest):
         "tenant": "demo-tenant",
     }
 
-    token_str = jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
+    token_str = sign_jwt(payload)
     return {"access_token": token_str, "token_type": "bearer", "expires_in": JWT_TTL_SECONDS}
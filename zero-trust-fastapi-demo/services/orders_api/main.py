@@ -1,121 +1,326 @@
+import asyncio
+import base64
+import binascii
+import functools
+import hashlib
+import hmac
+import logging
+import os
+import queue
+import sys
+import threading
 import time
-from typing import Any, Callable
+from collections import defaultdict
+from itertools import count
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Awaitable, Callable
 
 from fastapi import FastAPI, Depends, HTTPException, Header, Request, status
-from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jose import jwt, JWTError
+from fastapi.responses import ORJSONResponse
+from cachetools import TTLCache
+import orjson
 from prometheus_client import Counter, Histogram, generate_latest
 from starlette.responses import Response
 
-app = FastAPI(title="orders-api", version="1.0.0")
+app = FastAPI(title="orders-api", version="1.0.0", default_response_class=ORJSONResponse)
+
+# Request logs go through a queue so the write to stdout happens on a background thread.
+# Set LOG_LEVEL=WARNING to skip per-request logging entirely.
+logger = logging.getLogger(__name__)
+_log_level = logging.getLevelName(os.environ.get("LOG_LEVEL", "INFO").upper())
+logger.setLevel(_log_level if isinstance(_log_level, int) else logging.INFO)
+logger.propagate = False
+_log_queue: queue.SimpleQueue = queue.SimpleQueue()
+logger.addHandler(QueueHandler(_log_queue))
+_log_listener = QueueListener(_log_queue, logging.StreamHandler(sys.stdout))
+
+@app.on_event("startup")
+async def start_log_listener() -> None:
+    _log_listener.start()
+
+@app.on_event("shutdown")
+async def stop_log_listener() -> None:
+    _log_listener.stop()
 
 JWT_ISSUER = "demo-auth"
 JWT_AUDIENCE = "orders-api"
 JWT_SECRET = "dev-secret-change-me"
 JWT_ALG = "HS256"
+_JWT_SECRET_BYTES = JWT_SECRET.encode("ascii")
+
+class InvalidTokenError(Exception):
+    pass
 
-bearer = HTTPBearer(auto_error=False)
+# Verified payloads keyed by token hash, so clients reusing a token skip re-decoding.
+# Each entry also carries the token's own exp so expiry is enforced exactly.
+TOKEN_CACHE_TTL_SECONDS = 30
+_payload_cache: TTLCache = TTLCache(maxsize=10000, ttl=TOKEN_CACHE_TTL_SECONDS)
+_payload_cache_lock = threading.Lock()
 
 # Minimal observability to reinforce "continuous verification"
 REQUESTS = Counter("zt_requests_total", "Total requests", ["path", "method", "status"])
 LATENCY = Histogram("zt_request_latency_seconds", "Request latency seconds", ["path"])
 
+# Label children for the known routes, built once so the hot path is a plain dict hit
+_KNOWN_ROUTES = [("/orders", "GET"), ("/orders", "POST"), ("/admin/audit", "GET")]
+# Probe/scrape traffic is passed straight through without being timed or logged
+_UNMETERED_PATHS = frozenset({"/health", "/metrics"})
+_KNOWN_STATUSES = [200, 401, 403, 422, 500]
+_REQ_CHILD = {
+    (path, method, code): REQUESTS.labels(path=path, method=method, status=str(code))
+    for path, method in _KNOWN_ROUTES
+    for code in _KNOWN_STATUSES
+}
+_LAT_CHILD = {path: LATENCY.labels(path=path) for path, _ in _KNOWN_ROUTES}
+
+# Latency samples are buffered per path and written to the histogram in batches
+LATENCY_FLUSH_INTERVAL_SECONDS = 0.1
+_pending_latency: defaultdict[str, list[float]] = defaultdict(list)
+_pending_latency_lock = threading.Lock()
+_flush_task: asyncio.Task | None = None
+
+def _flush_latency() -> None:
+    global _pending_latency
+    with _pending_latency_lock:
+        if not _pending_latency:
+            return
+        pending, _pending_latency = _pending_latency, defaultdict(list)
+    for path, samples in pending.items():
+        lat_child = _LAT_CHILD.get(path)
+        if lat_child is None:
+            lat_child = LATENCY.labels(path=path)
+        for elapsed in samples:
+            lat_child.observe(elapsed)
+
+async def _flush_latency_loop() -> None:
+    while True:
+        await asyncio.sleep(LATENCY_FLUSH_INTERVAL_SECONDS)
+        _flush_latency()
+
+@app.on_event("startup")
+async def start_latency_flush() -> None:
+    global _flush_task
+    _flush_task = asyncio.create_task(_flush_latency_loop())
+
+@app.on_event("shutdown")
+async def stop_latency_flush() -> None:
+    if _flush_task is not None:
+        _flush_task.cancel()
+    _flush_latency()
+
 ORDERS = [
     {"id": "A100", "total": 42.50},
     {"id": "B200", "total": 13.37},
 ]
+_order_seq = count(len(ORDERS) + 1)
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: avoids the per-request task BaseHTTPMiddleware spawns
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in _UNMETERED_PATHS:
+            return await self.app(scope, receive, send)
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        start = time.perf_counter_ns()
+        await self.app(scope, receive, send_wrapper)
+        elapsed_ns = time.perf_counter_ns() - start
 
-@app.middleware("http")
-async def metrics_and_log(request: Request, call_next):
-    start = time.time()
-    response = await call_next(request)
-    elapsed = time.time() - start
+        path, method = scope["path"], scope["method"]
+        req_child = _REQ_CHILD.get((path, method, status_code))
+        if req_child is None:
+            req_child = REQUESTS.labels(path=path, method=method, status=str(status_code))
+        req_child.inc()
+        with _pending_latency_lock:
+            _pending_latency[path].append(elapsed_ns / 1e9)
 
-    REQUESTS.labels(path=request.url.path, method=request.method, status=str(response.status_code)).inc()
-    LATENCY.labels(path=request.url.path).observe(elapsed)
+        elapsed_ms = elapsed_ns // 1_000_000
+        logger.info("%s %s -> %s (%dms)", method, path, status_code, elapsed_ms)
 
-    elapsed_ms = int(elapsed * 1000)
-    print(f"{request.method} {request.url.path} -> {response.status_code} ({elapsed_ms}ms)")
-    return response
+app.add_middleware(MetricsMiddleware)
+
+# Fixed probe responses: /health never changes, /metrics is regenerated at most once a second
+_HEALTH_RESP_BYTES = b'{"ok":true}'
+METRICS_CACHE_SECONDS = 1.0
+_metrics_body = b""
+_metrics_generated_at = float("-inf")
+_metrics_lock = asyncio.Lock()
 
 @app.get("/metrics")
-def metrics():
-    return Response(generate_latest(), media_type="text/plain; version=0.0.4")
+async def metrics():
+    global _metrics_body, _metrics_generated_at
+    async with _metrics_lock:
+        now = time.monotonic()
+        if now - _metrics_generated_at >= METRICS_CACHE_SECONDS:
+            _flush_latency()
+            _metrics_body = generate_latest()
+            _metrics_generated_at = now
+    return Response(_metrics_body, media_type="text/plain; version=0.0.4")
 
 @app.get("/health")
-def health():
-    return {"ok": True}
+async def health():
+    return Response(content=_HEALTH_RESP_BYTES, media_type="application/json")
+
+def _b64url_encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+def _b64url_decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + "=" * (-len(segment) % 4))
+
+def _is_numeric(value: Any) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def _fast_verify(tok: str) -> dict[str, Any]:
+    # HS256-only verifier: check the signature first, then decode and validate claims
+    try:
+        h, p, sig_b64 = tok.split(".")
+        sig = _b64url_decode(sig_b64)
+        expected = hmac.new(_JWT_SECRET_BYTES, f"{h}.{p}".encode("ascii"), hashlib.sha256).digest()
+        if not hmac.compare_digest(sig, expected):
+            raise InvalidTokenError("signature verification failed")
+        header = orjson.loads(_b64url_decode(h))
+        payload = orjson.loads(_b64url_decode(p))
+    except (ValueError, binascii.Error, UnicodeEncodeError):
+        raise InvalidTokenError("malformed token")
+
+    if not isinstance(header, dict) or header.get("alg") != JWT_ALG:
+        raise InvalidTokenError("unexpected algorithm")
+    if not isinstance(payload, dict):
+        raise InvalidTokenError("invalid payload")
 
-def require_jwt(creds: HTTPAuthorizationCredentials = Depends(bearer)) -> dict[str, Any]:
-    if creds is None:
+    now = time.time()
+    exp = payload.get("exp")
+    if not _is_numeric(exp) or exp <= now:
+        raise InvalidTokenError("token expired")
+    if "nbf" in payload and (not _is_numeric(payload["nbf"]) or payload["nbf"] > now):
+        raise InvalidTokenError("token not yet valid")
+    if "iat" in payload and not _is_numeric(payload["iat"]):
+        raise InvalidTokenError("invalid iat")
+    if payload.get("iss") != JWT_ISSUER:
+        raise InvalidTokenError("invalid issuer")
+    aud = payload.get("aud")
+    if aud != JWT_AUDIENCE and not (isinstance(aud, list) and JWT_AUDIENCE in aud):
+        raise InvalidTokenError("invalid audience")
+    return payload
+
+@app.on_event("startup")
+async def warm_up_jwt() -> None:
+    # Sign and verify a throwaway token so first-call costs (HMAC init, orjson, base64)
+    # are paid before serving traffic. The token cache is deliberately bypassed.
+    claims = {"iss": JWT_ISSUER, "aud": JWT_AUDIENCE, "exp": int(time.time()) + 60}
+    header = {"alg": JWT_ALG, "typ": "JWT"}
+    signing_input = f"{_b64url_encode(orjson.dumps(header))}.{_b64url_encode(orjson.dumps(claims))}"
+    sig = hmac.new(_JWT_SECRET_BYTES, signing_input.encode("ascii"), hashlib.sha256).digest()
+    _fast_verify(f"{signing_input}.{_b64url_encode(sig)}")
+
+async def require_jwt(authorization: str | None = Header(default=None, include_in_schema=False)) -> dict[str, Any]:
+    if authorization is None or authorization[:7].lower() != "bearer " or len(authorization) < 8:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="missing bearer token")
 
-    token_str = creds.credentials
+    token_str = authorization[7:]
+    key = hashlib.sha256(token_str.encode()).hexdigest()[:32]
+    now = time.time()
+    with _payload_cache_lock:
+        cached = _payload_cache.get(key)
+    if cached is not None:
+        payload, expires_at = cached
+        if now < expires_at:
+            return payload
+
     try:
-        payload = jwt.decode(
-            token_str,
-            JWT_SECRET,
-            algorithms=[JWT_ALG],
-            audience=JWT_AUDIENCE,
-            issuer=JWT_ISSUER,
-        )
-        return payload
-    except JWTError:
+        payload = _fast_verify(token_str)
+    except InvalidTokenError:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid token")
 
-def require_scope(scope: str) -> Callable[[dict[str, Any]], dict[str, Any]]:
-    def _check(user: dict[str, Any] = Depends(require_jwt)) -> dict[str, Any]:
+    # Only successful verifications are cached, never for longer than the token lives
+    expires_at = min(now + TOKEN_CACHE_TTL_SECONDS, payload.get("exp", now))
+    with _payload_cache_lock:
+        _payload_cache[key] = (payload, expires_at)
+    return payload
+
+@functools.lru_cache(maxsize=None)
+def require_scope(scope: str) -> Callable[[dict[str, Any]], Awaitable[dict[str, Any]]]:
+    async def _check(user: dict[str, Any] = Depends(require_jwt)) -> dict[str, Any]:
         scopes = user.get("scp", [])
         if scope not in scopes:
             raise HTTPException(status_code=403, detail=f"missing scope: {scope}")
         return user
     return _check
 
-def require_role(role: str) -> Callable[[dict[str, Any]], dict[str, Any]]:
-    def _check(user: dict[str, Any] = Depends(require_jwt)) -> dict[str, Any]:
+@functools.lru_cache(maxsize=None)
+def require_role(role: str) -> Callable[[dict[str, Any]], Awaitable[dict[str, Any]]]:
+    async def _check(user: dict[str, Any] = Depends(require_jwt)) -> dict[str, Any]:
         if user.get("role") != role:
             raise HTTPException(status_code=403, detail=f"requires role: {role}")
         return user
     return _check
 
-def require_context(
-    x_device_trust: str | None = Header(default=None),
-    x_risk: str | None = Header(default=None),
-) -> bool:
+def require_context(request: Request) -> None:
     # Demo Conditional Access:
     # - must be managed device
     # - deny if risk is high
-    if x_device_trust != "managed":
+    # Called inline by the endpoints (after auth) rather than via Depends.
+    headers = request.headers
+    if headers.get("x-device-trust") != "managed":
         raise HTTPException(status_code=403, detail="device not compliant (expected X-Device-Trust: managed)")
-    if x_risk == "high":
+    if headers.get("x-risk") == "high":
         raise HTTPException(status_code=403, detail="risk too high (expected X-Risk != high)")
-    return True
 
-@app.get("/orders")
-def list_orders(
+# The bearer token and context headers are read by hand, so declare them for /docs here
+_BEARER_SCHEME = {"HTTPBearer": {"type": "http", "scheme": "bearer"}}
+_PROTECTED_ROUTE_DOCS = {
+    "security": [{"HTTPBearer": []}],
+    "parameters": [
+        {"name": "x-device-trust", "in": "header", "required": False, "schema": {"type": "string", "title": "X-Device-Trust"}},
+        {"name": "x-risk", "in": "header", "required": False, "schema": {"type": "string", "title": "X-Risk"}},
+    ],
+}
+_default_openapi = app.openapi
+
+def _openapi() -> dict[str, Any]:
+    schema = _default_openapi()
+    schema.setdefault("components", {}).setdefault("securitySchemes", {}).update(_BEARER_SCHEME)
+    return schema
+
+app.openapi = _openapi
+
+@app.get("/orders", openapi_extra=_PROTECTED_ROUTE_DOCS)
+async def list_orders(
+    request: Request,
     user: dict[str, Any] = Depends(require_scope("orders:read")),
-    _ctx: bool = Depends(require_context),
 ):
+    require_context(request)
     return {
         "caller": {"sub": user.get("sub"), "role": user.get("role"), "scp": user.get("scp"), "tenant": user.get("tenant")},
         "orders": ORDERS,
     }
 
-@app.post("/orders")
-def create_order(
+@app.post("/orders", openapi_extra=_PROTECTED_ROUTE_DOCS)
+async def create_order(
+    request: Request,
     user: dict[str, Any] = Depends(require_scope("orders:write")),
-    _ctx: bool = Depends(require_context),
 ):
+    require_context(request)
     # Minimal "write" action for demo
-    new_id = f"X{len(ORDERS)+1:03d}"
+    new_id = f"X{next(_order_seq):03d}"
     ORDERS.append({"id": new_id, "total": 9.99})
     return {"ok": True, "created": new_id, "created_by": user.get("sub")}
 
-@app.get("/admin/audit")
-def admin_audit(
+@app.get("/admin/audit", openapi_extra=_PROTECTED_ROUTE_DOCS)
+async def admin_audit(
+    request: Request,
     user: dict[str, Any] = Depends(require_role("admin")),
-    _ctx: bool = Depends(require_context),
 ):
+    require_context(request)
     # Demo "sensitive endpoint" protected by RBAC
     return {
         "ok": True,
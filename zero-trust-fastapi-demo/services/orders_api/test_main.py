@@ -0,0 +1,64 @@
+import asyncio
+import hashlib
+import hmac
+import time
+
+import orjson
+import pytest
+from fastapi import HTTPException
+
+import main
+
+
+def make_token(claims=None, header=None, secret=main._JWT_SECRET_BYTES):
+    now = int(time.time())
+    payload = {"iss": main.JWT_ISSUER, "aud": main.JWT_AUDIENCE, "iat": now, "exp": now + 60, "sub": "ola"}
+    payload.update(claims or {})
+    header = header or {"alg": main.JWT_ALG, "typ": "JWT"}
+    signing_input = f"{main._b64url_encode(orjson.dumps(header))}.{main._b64url_encode(orjson.dumps(payload))}"
+    sig = hmac.new(secret, signing_input.encode("ascii"), hashlib.sha256).digest()
+    return f"{signing_input}.{main._b64url_encode(sig)}"
+
+
+def test_fast_verify_accepts_valid_token():
+    assert main._fast_verify(make_token())["sub"] == "ola"
+
+
+@pytest.mark.parametrize(
+    "token",
+    [
+        pytest.param(make_token(secret=b"wrong-secret"), id="bad-signature"),
+        pytest.param(make_token(header={"alg": "HS512", "typ": "JWT"}), id="alg-hs512"),
+        pytest.param(make_token(header={"alg": "none", "typ": "JWT"}), id="alg-none"),
+        pytest.param(make_token({"iss": "someone-else"}), id="wrong-iss"),
+        pytest.param(make_token({"aud": "billing-api"}), id="wrong-aud"),
+        pytest.param(make_token({"exp": int(time.time()) - 1}), id="expired"),
+        pytest.param(make_token({"nbf": int(time.time()) + 999}), id="future-nbf"),
+        pytest.param(make_token({"iat": "x"}), id="non-numeric-iat"),
+        pytest.param("not.a.jwt", id="malformed"),
+    ],
+)
+def test_fast_verify_rejects(token):
+    with pytest.raises(main.InvalidTokenError):
+        main._fast_verify(token)
+
+
+@pytest.mark.parametrize("scheme", ["Bearer", "bearer", "BEARER"])
+def test_require_jwt_accepts_scheme_case_insensitively(scheme):
+    token = make_token()
+    assert asyncio.run(main.require_jwt(f"{scheme} {token}"))["sub"] == "ola"
+
+
+@pytest.mark.parametrize("authorization", [None, "", "Bearer ", "Basic abc", "Bearerxyz"])
+def test_require_jwt_rejects_missing_bearer_token(authorization):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.require_jwt(authorization))
+    assert exc.value.status_code == 401
+
+
+def test_openapi_documents_bearer_scheme_and_context_headers():
+    schema = main.app.openapi()
+    assert schema["components"]["securitySchemes"]["HTTPBearer"] == {"type": "http", "scheme": "bearer"}
+    operation = schema["paths"]["/orders"]["get"]
+    assert operation["security"] == [{"HTTPBearer": []}]
+    assert {p["name"] for p in operation["parameters"]} == {"x-device-trust", "x-risk"}